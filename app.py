@@ -3,6 +3,10 @@ import re
 import json
 import os
 
+from route_analyzer import check_route_conflicts, parse_route_table, find_route, get_route_table
+from cidr_set import compile_rules
+from rules import RuleSet, int_to_ip, prefix_to_netmask
+
 # 配置文件路径
 CONFIG_FILE = os.path.join('config', 'network_config.json')
 
@@ -21,7 +25,9 @@ IP_CIDRS = [
     "IP-CIDR,192.168.1.1/24,DIRECT"
 ]
 
-def save_config(user_connection, campus_connection, user_gateway, campus_gateway):
+def save_config(user_connection, campus_connection, user_gateway, campus_gateway, applied_cidrs=None):
+    # 保留已有配置中的排除网段
+    old_config = load_config() or {}
     # 确保配置目录存在
     os.makedirs('config', exist_ok=True)
     config = {
@@ -29,7 +35,9 @@ def save_config(user_connection, campus_connection, user_gateway, campus_gateway
         'campus_connection': campus_connection,
         'user_gateway': user_gateway,
         'campus_gateway': campus_gateway,
-        'ip_cidrs': IP_CIDRS
+        'ip_cidrs': IP_CIDRS,
+        'exclude_cidrs': old_config.get('exclude_cidrs', []),
+        'applied_cidrs': applied_cidrs or []
     }
     with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
         json.dump(config, f, ensure_ascii=False, indent=4)
@@ -40,8 +48,61 @@ def load_config():
             return json.load(f)
     return None
 
-def reset_settings():
+def get_rules(config):
+    """
+    获取实际生效的路由规则，配置了 exclude_cidrs 时从 ip_cidrs 中排除这些网段
+    exclude_cidrs 中有无效网段时抛出 ValueError，避免被排除的网段仍然走校园网
+    """
+    rules = RuleSet.from_strings(config['ip_cidrs'])
+    exclude_cidrs = config.get('exclude_cidrs')
+    if not exclude_cidrs:
+        return rules
+    return compile_rules(rules, RuleSet.from_strings(exclude_cidrs, strict=True))
+
+def filter_rules(rules, prefixes, include=True):
+    """
+    按 (网络地址, 前缀长度) 是否属于 prefixes 筛选 IPv4 规则
+    """
+    result = RuleSet()
+    for network, prefix, action in rules.ipv4():
+        if ((network, prefix) in prefixes) == include:
+            result.add(network, prefix, action)
+    return result
+
+def get_reset_rules(config, rules):
+    """
+    获取重置时需要删除的路由：当前规则、上次实际添加的路由 (applied_cidrs)，
+    以及配置了 exclude_cidrs 时未排除网段的原始规则，前缀相同的只保留一条
+    """
+    result = filter_rules(rules, set())
+    sources = [config.get('applied_cidrs', [])]
+    if config.get('exclude_cidrs'):
+        sources.append(config['ip_cidrs'])
+    for source in sources:
+        seen = {(network, prefix) for network, prefix, _ in result.ipv4()}
+        for network, prefix, action in filter_rules(RuleSet.from_strings(source), seen, False).ipv4():
+            result.add(network, prefix, action)
+    return result
+
+def save_applied_cidrs(applied):
+    """
+    记录本工具实际添加到系统中的路由，再次应用和重置时据此删除
+    """
     config = load_config()
+    if not config:
+        return
+    config['applied_cidrs'] = applied.cidrs()
+    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=4)
+
+def reset_settings(config=None, route_output=None, rules=None):
+    """
+    重置跃点数并删除添加的路由
+    提供 route_output 时使用该路由表判断路由是否存在，否则读取一次当前路由表
+    提供 rules 时直接使用已解析的规则
+    """
+    if config is None:
+        config = load_config()
     if not config:
         print("未找到保存的配置，无法重置。")
         return
@@ -52,7 +113,8 @@ def reset_settings():
     try:
         # 重置 IPv4 跃点数为自动
         subprocess.run(['netsh', 'interface', 'ipv4', 'set', 'interface', 
-                       config['user_connection'], 'metric=auto'], check=True)
+                       config['user_connection'], 'metric=auto'], check=True,
+                       capture_output=True, text=True)
         print(f"已重置 {config['user_connection']} 的 IPv4 跃点数为自动")
     except subprocess.CalledProcessError as e:
         print(f"重置 {config['user_connection']} 的 IPv4 跃点数时出错: {e}")
@@ -60,7 +122,8 @@ def reset_settings():
     try:
         # 重置 IPv6 跃点数为自动
         subprocess.run(['netsh', 'interface', 'ipv6', 'set', 'interface', 
-                       config['user_connection'], 'metric=auto'], check=True)
+                       config['user_connection'], 'metric=auto'], check=True,
+                       capture_output=True, text=True)
         print(f"已重置 {config['user_connection']} 的 IPv6 跃点数为自动")
     except subprocess.CalledProcessError as e:
         print(f"重置 {config['user_connection']} 的 IPv6 跃点数时出错: {e}")
@@ -68,61 +131,22 @@ def reset_settings():
     try:
         # 重置 IPv6 跃点数为自动
         subprocess.run(['netsh', 'interface', 'ipv6', 'set', 'interface', 
-                       config['campus_connection'], 'metric=auto'], check=True)
+                       config['campus_connection'], 'metric=auto'], check=True,
+                       capture_output=True, text=True)
         print(f"已重置 {config['campus_connection']} 的 IPv6 跃点数为自动")
     except subprocess.CalledProcessError as e:
         print(f"重置 {config['campus_connection']} 的 IPv6 跃点数时出错: {e}")
 
-    # 删除路由
-    for ip_cidr in config['ip_cidrs']:
+    # 删除经由校园网网关的当前规则和之前添加过的路由
+    if rules is None:
         try:
-            # 解析 IP-CIDR 格式
-            parts = ip_cidr.split(',')
-            if len(parts) != 3:
-                print(f"无效的路由格式: {ip_cidr}")
-                continue
-                
-            ip_cidr_part = parts[1]
-            ip, cidr = ip_cidr_part.split('/')
-            
-            # 将 CIDR 转换为子网掩码
-            cidr = int(cidr)
-            if not (0 <= cidr <= 32):
-                print(f"无效的 CIDR 值: {cidr}")
-                continue
-                
-            # 计算子网掩码
-            mask = (0xffffffff >> (32 - cidr)) << (32 - cidr)
-            mask_parts = [
-                (mask >> 24) & 0xff,
-                (mask >> 16) & 0xff,
-                (mask >> 8) & 0xff,
-                mask & 0xff
-            ]
-            netmask = '.'.join(map(str, mask_parts))
-            
-            # 检查路由是否存在
-            check_result = subprocess.run(['route', 'print', ip], capture_output=True, text=True)
-            if check_result.returncode != 0 or ip not in check_result.stdout:
-                print(f"路由不存在: {ip} 掩码 {netmask}")
-                continue
-            
-            # 删除路由
-            result = subprocess.run(['route', 'delete', ip, 'mask', netmask], 
-                                 capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                print(f"已删除路由: {ip} 掩码 {netmask}")
-            else:
-                error_msg = result.stderr.strip()
-                if "找不到元素" in error_msg or "The element was not found" in error_msg:
-                    print(f"路由不存在: {ip} 掩码 {netmask}")
-                else:
-                    print(f"删除路由失败: {ip} 掩码 {netmask}")
-                    print(f"错误信息: {error_msg}")
-                
-        except Exception as e:
-            print(f"处理路由 {ip_cidr} 时出错: {e}")
+            rules = get_rules(config)
+        except ValueError as e:
+            # 排除网段无效时按未排除的原始规则删除
+            print(f"排除网段无效: {e}")
+            rules = RuleSet.from_strings(config['ip_cidrs'])
+    delete_routes(config['campus_gateway'], get_reset_rules(config, rules), route_output)
+    save_applied_cidrs(RuleSet())
 
     print("\n重置完成！")
     # 不再删除配置文件
@@ -230,39 +254,70 @@ def set_metric(connection, protocol, metric):
         print(f"设置 {connection} 的 {protocol} 跃点数时出错: {e}")
         return False
 
-def add_routes(gateway, ip_cidrs):
-    for ip_cidr in ip_cidrs:
+def delete_routes(gateway, rules, route_output=None):
+    """
+    删除经由指定网关的路由，其他程序 (例如 VPN) 添加的同前缀路由不会被删除
+    提供 route_output 时使用该路由表判断路由是否存在，否则读取一次当前路由表
+    """
+    if route_output is None:
+        route_output = get_route_table()
+        if route_output is None:
+            print("无法读取路由表，跳过删除路由")
+            return
+    existing_routes = {(route['start'], route['prefix'], route['gateway'])
+                       for route in parse_route_table(route_output)}
+
+    for network, prefix, _ in rules.ipv4():
+        ip = int_to_ip(network)
+        netmask = prefix_to_netmask(prefix)
         try:
-            # 解析 IP-CIDR 格式
-            parts = ip_cidr.split(',')
-            if len(parts) != 3:
-                print(f"无效的路由格式: {ip_cidr}")
+            # 检查经由该网关的路由是否存在
+            if (network, prefix, gateway) not in existing_routes:
+                print(f"路由不存在: {ip} 掩码 {netmask} 经由 {gateway}")
                 continue
-                
-            ip_cidr_part = parts[1]
-            ip, cidr = ip_cidr_part.split('/')
             
-            # 将 CIDR 转换为子网掩码
-            cidr = int(cidr)
-            if not (0 <= cidr <= 32):
-                print(f"无效的 CIDR 值: {cidr}")
-                continue
-                
-            # 计算子网掩码
-            mask = (0xffffffff >> (32 - cidr)) << (32 - cidr)
-            mask_parts = [
-                (mask >> 24) & 0xff,
-                (mask >> 16) & 0xff,
-                (mask >> 8) & 0xff,
-                mask & 0xff
-            ]
-            netmask = '.'.join(map(str, mask_parts))
+            # 删除路由，指定网关以免删除其他程序添加的同前缀路由
+            result = subprocess.run(['route', 'delete', ip, 'mask', netmask, gateway], 
+                                 capture_output=True, text=True)
             
+            if result.returncode == 0:
+                print(f"已删除路由: {ip} 掩码 {netmask} 经由 {gateway}")
+            else:
+                error_msg = result.stderr.strip()
+                if "找不到元素" in error_msg or "The element was not found" in error_msg:
+                    print(f"路由不存在: {ip} 掩码 {netmask} 经由 {gateway}")
+                else:
+                    print(f"删除路由失败: {ip} 掩码 {netmask} 经由 {gateway}")
+                    print(f"错误信息: {error_msg}")
+                
+        except Exception as e:
+            print(f"处理路由 {ip}/{prefix} 时出错: {e}")
+
+def add_routes(gateway, rules, existing_routes=None):
+    """
+    添加路由规则，返回本次实际添加的路由，已存在的路由可能属于其他程序，不计入
+    existing_routes 为已有路由的 (网络地址, 前缀长度) 集合，未提供时读取一次当前路由表
+    """
+    if existing_routes is None:
+        route_output = get_route_table()
+        if route_output is not None:
+            existing_routes = {(route['start'], route['prefix']) for route in parse_route_table(route_output)}
+
+    applied = RuleSet()
+    for network, prefix, action in rules.ipv4():
+        ip = int_to_ip(network)
+        netmask = prefix_to_netmask(prefix)
+        try:
             # 检查路由是否已存在
-            check_result = subprocess.run(['route', 'print', ip], capture_output=True, text=True)
-            if check_result.returncode == 0 and ip in check_result.stdout:
-                print(f"路由已存在: {ip} 掩码 {netmask}")
-                continue
+            if existing_routes is not None:
+                if (network, prefix) in existing_routes:
+                    print(f"路由已存在: {ip} 掩码 {netmask}")
+                    continue
+            else:
+                check_result = subprocess.run(['route', 'print', ip], capture_output=True, text=True)
+                if check_result.returncode == 0 and ip in check_result.stdout:
+                    print(f"路由已存在: {ip} 掩码 {netmask}")
+                    continue
             
             # 添加路由
             result = subprocess.run(['route', 'add', ip, 'mask', netmask, gateway, '-p'], 
@@ -270,6 +325,7 @@ def add_routes(gateway, ip_cidrs):
             
             if result.returncode == 0:
                 print(f"已添加路由: {ip} 掩码 {netmask} 到 {gateway}")
+                applied.add(network, prefix, action)
             else:
                 error_msg = result.stderr.strip()
                 if "对象已存在" in error_msg or "The object already exists" in error_msg:
@@ -279,20 +335,25 @@ def add_routes(gateway, ip_cidrs):
                     print(f"错误信息: {error_msg}")
                 
         except Exception as e:
-            print(f"处理路由 {ip_cidr} 时出错: {e}")
+            print(f"处理路由 {ip}/{prefix} 时出错: {e}")
 
-def show_current_routes():
+    return applied
+
+def show_current_routes(route_output=None):
     """
     显示当前系统中的路由配置
+    未提供 route_output 时读取当前系统路由表
     """
     try:
         # 获取当前路由表
-        result = subprocess.run(['route', 'print'], capture_output=True, text=True)
-        if result.returncode != 0:
-            print("获取路由表失败")
-            return
+        if route_output is None:
+            result = subprocess.run(['route', 'print'], capture_output=True, text=True)
+            if result.returncode != 0:
+                print("获取路由表失败")
+                return
+            route_output = result.stdout
 
-        routes = result.stdout.split('\n')
+        routes = route_output.split('\n')
         
         # 查找IPv4路由表的开始位置
         start_index = -1
@@ -340,6 +401,81 @@ def show_current_routes():
     except Exception as e:
         print(f"显示路由配置时出错: {e}")
 
+def show_route_for(ip, route_output=None):
+    """
+    显示访问指定地址时匹配的路由
+    未提供 route_output 时读取当前系统路由表
+    """
+    if route_output is None:
+        route_output = get_route_table()
+        if route_output is None:
+            return
+    try:
+        route = find_route(parse_route_table(route_output), ip)
+    except ValueError as e:
+        print(e)
+        return
+    if route is None:
+        print(f"没有匹配 {ip} 的路由")
+        return
+    print(f"{ip} 匹配路由 {route['network']}/{route['prefix']} 经由 {route['gateway']} "
+          f"(接口 {route['interface']}, 跃点数 {route['metric']})")
+
+def update_routes(config, rules, route_output=None, existing_routes=None):
+    """
+    删除之前添加、但已不属于当前规则的路由 (例如新增排除网段前添加的原始网段)，
+    然后添加当前规则，返回本工具添加的全部路由
+    """
+    owned = RuleSet.from_strings(config.get('applied_cidrs', []))
+    prefixes = {(network, prefix) for network, prefix, _ in rules.ipv4()}
+    stale = filter_rules(owned, prefixes, False)
+    if stale:
+        print("\n删除过期的路由...")
+        delete_routes(config['campus_gateway'], stale, route_output)
+
+    added = add_routes(config['campus_gateway'], rules, existing_routes)
+
+    # 之前添加且仍属于当前规则的路由继续由本工具管理
+    applied = filter_rules(owned, prefixes)
+    owned_prefixes = {(network, prefix) for network, prefix, _ in applied.ipv4()}
+    for network, prefix, action in filter_rules(added, owned_prefixes, False).ipv4():
+        applied.add(network, prefix, action)
+    return applied
+
+def apply_settings(config, route_output=None, rules=None):
+    """
+    使用已保存的配置设置跃点数并添加路由，排除网段无效时不做任何修改并返回 False
+    提供 route_output 时使用该路由表快照检查冲突和已有路由
+    提供 rules 时直接使用已解析的规则
+    """
+    if rules is None:
+        try:
+            rules = get_rules(config)
+        except ValueError as e:
+            print(f"排除网段无效，已取消应用: {e}")
+            return False
+
+    user_connection = config['user_connection']
+    campus_connection = config['campus_connection']
+    campus_gateway = config['campus_gateway']
+
+    print("\n开始设置跃点数...")
+    set_metric(campus_connection, 'ipv6', 1)
+    set_metric(user_connection, 'ipv4', 1)
+    set_metric(user_connection, 'ipv6', 999)
+
+    print("\n检查路由冲突...")
+    existing_routes = None
+    if route_output is not None:
+        existing_routes = {(route['start'], route['prefix']) for route in parse_route_table(route_output)}
+    check_route_conflicts(campus_gateway, rules, route_output)
+
+    print("\n开始添加路由...")
+    applied = update_routes(config, rules, route_output, existing_routes)
+    save_applied_cidrs(applied)
+    print("\n路由配置完成！")
+    return True
+
 if __name__ == "__main__":
     import sys
     
@@ -351,11 +487,28 @@ if __name__ == "__main__":
         elif sys.argv[1] == '--show':
             show_current_routes()
             sys.exit(0)
+        elif sys.argv[1] == '--which' and len(sys.argv) > 2:
+            show_route_for(sys.argv[2])
+            sys.exit(0)
+        elif sys.argv[1] == '--analyze':
+            config = load_config()
+            if config:
+                try:
+                    rules = get_rules(config)
+                except ValueError as e:
+                    print(f"排除网段无效: {e}")
+                    sys.exit(1)
+                check_route_conflicts(config['campus_gateway'], rules)
+            else:
+                check_route_conflicts(None, RuleSet.from_strings(IP_CIDRS))
+            sys.exit(0)
         else:
             print("无效的参数")
             print("可用参数:")
             print("  --reset  重置网络设置")
             print("  --show   显示当前路由配置")
+            print("  --analyze 分析路由规则与系统路由表的冲突")
+            print("  --which <IP> 显示访问指定地址时匹配的路由")
             sys.exit(1)
 
     # 检查是否存在配置文件
@@ -366,20 +519,7 @@ if __name__ == "__main__":
         print(f"校园网络连接: {config['campus_connection']}")
         use_saved = input("\n是否使用已保存的配置？(y/n): ")
         if use_saved.lower() == 'y':
-            user_connection = config['user_connection']
-            campus_connection = config['campus_connection']
-            user_gateway = config['user_gateway']
-            campus_gateway = config['campus_gateway']
-            
-            print("\n开始设置跃点数...")
-            set_metric(campus_connection, 'ipv6', 1)
-            set_metric(user_connection, 'ipv4', 1)
-            set_metric(user_connection, 'ipv6', 999)
-
-            print("\n开始添加路由...")
-            add_routes(campus_gateway, config['ip_cidrs'])
-            print("\n路由配置完成！")
-            sys.exit(0)
+            sys.exit(0 if apply_settings(config) else 1)
 
     connections = get_network_connections()
     if not connections:
@@ -449,7 +589,15 @@ if __name__ == "__main__":
     print(f"你的网络网关: {user_gateway}")
     print(f"校园网络网关: {campus_gateway}")
     print("\n将添加的路由规则:")
-    for ip_cidr in IP_CIDRS:
+    try:
+        rules = get_rules({
+            'ip_cidrs': IP_CIDRS,
+            'exclude_cidrs': config.get('exclude_cidrs', []) if config else []
+        })
+    except ValueError as e:
+        print(f"排除网段无效，已取消设置: {e}")
+        sys.exit(1)
+    for ip_cidr in rules.to_strings():
         print(f"- {ip_cidr}")
     print("=" * 50)
 
@@ -465,11 +613,18 @@ if __name__ == "__main__":
         set_metric(user_connection, 'ipv4', 1)
         set_metric(user_connection, 'ipv6', 999)
 
+        print("\n检查路由冲突...")
+        check_route_conflicts(campus_gateway, rules)
+
         print("\n开始添加路由...")
-        add_routes(campus_gateway, IP_CIDRS)
+        if config:
+            applied = update_routes(config, rules)
+        else:
+            applied = add_routes(campus_gateway, rules)
         
         # 保存配置
-        save_config(user_connection, campus_connection, user_gateway, campus_gateway)
+        save_config(user_connection, campus_connection, user_gateway, campus_gateway,
+                    applied.cidrs())
         print("\n配置已保存。")
         print("\n路由配置完成！")
     else:
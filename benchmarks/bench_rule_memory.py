@@ -0,0 +1,45 @@
+"""
+比较路由规则使用字符串列表和 RuleSet 两种表示时的内存占用
+
+用法: python benchmarks/bench_rule_memory.py [规则数量]
+"""
+import os
+import sys
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules import RuleSet, int_to_ip
+
+def generate_rules(count):
+    random.seed(0)
+    rules = []
+    for _ in range(count):
+        prefix = random.randint(8, 32)
+        network = random.getrandbits(32) & ((0xffffffff << (32 - prefix)) & 0xffffffff)
+        rules.append(f"IP-CIDR,{int_to_ip(network)}/{prefix},DIRECT")
+    return rules
+
+def measure(build):
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    source = '\n'.join(generate_rules(count))
+
+    # 两种表示都从同一份文本构建，只统计构建出的对象
+    strings, string_size = measure(lambda: source.split('\n'))
+    rules, rule_set_size = measure(lambda: RuleSet.from_strings(strings))
+
+    print(f"规则数量: {count}")
+    print(f"字符串列表: {string_size / 1024:.1f} KiB ({string_size / count:.1f} 字节/条)")
+    print(f"RuleSet:    {rule_set_size / 1024:.1f} KiB ({rule_set_size / count:.1f} 字节/条)")
+    print(f"节省: {1 - rule_set_size / string_size:.1%}")
+
+if __name__ == "__main__":
+    main()
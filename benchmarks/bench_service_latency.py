@@ -0,0 +1,64 @@
+"""
+比较每次启动 app.py 与向常驻服务发送请求的延迟
+
+用法: python benchmarks/bench_service_latency.py [重复次数]
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from service import AUTHKEY_FILE, request, is_running
+
+def measure(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    # 不能替换正在运行的服务的认证密钥
+    if is_running():
+        print("服务已在运行，请先运行 python service.py stop 再进行测试")
+        sys.exit(1)
+
+    cold = measure(lambda: subprocess.run([sys.executable, 'app.py', '--which', '8.8.8.8'],
+                                          capture_output=True), repeat)
+
+    # 没有服务在运行，残留的认证密钥已经失效
+    if os.path.exists(AUTHKEY_FILE):
+        os.remove(AUTHKEY_FILE)
+    server = subprocess.Popen([sys.executable, 'service.py', '--serve'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # 等待服务写入认证密钥并开始监听
+        deadline = time.time() + 30
+        while True:
+            try:
+                request('status')
+                break
+            except (FileNotFoundError, ConnectionRefusedError, EOFError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+        warm = measure(lambda: request('which', ['8.8.8.8']), repeat)
+        request('stop')
+    finally:
+        server.wait(timeout=10)
+
+    print(f"重复次数: {repeat}")
+    print(f"冷启动 (python app.py --which): {cold:.1f} ms")
+    print(f"常驻服务 (service.py which):    {warm:.1f} ms")
+    print(f"加速: {cold / warm:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import os
+import sys
+import heapq
+from typing import List, Tuple
+
+from rules import RuleSet, FAMILY_IPV6
+
+# IPv4 地址空间的上界 (不含)
+ADDRESS_SPACE_END = 1 << 32
+
+# 地址区间使用左闭右开的 (start, end) 表示，集合为按起始地址排序且互不相邻重叠的区间列表
+Interval = Tuple[int, int]
+
+def normalize(intervals: List[Interval]) -> List[Interval]:
+    """
+    排序并合并重叠或相邻的区间
+    """
+    result = []
+    for start, end in sorted(intervals):
+        if result and start <= result[-1][1]:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+def from_rules(rules: RuleSet) -> List[Interval]:
+    """
+    将规则集合中的 IPv4 规则转换为规范化的区间集合
+    """
+    return normalize([(network, network + (1 << (32 - prefix))) for network, prefix, _ in rules.ipv4()])
+
+def to_rules(intervals: List[Interval]) -> RuleSet:
+    """
+    将区间集合拆分为最少数量的 CIDR 前缀
+    """
+    rules = RuleSet()
+    for start, end in intervals:
+        while start < end:
+            # 取起始地址对齐允许的最大块，再缩小到不超出区间
+            size = start & -start if start else ADDRESS_SPACE_END
+            while size > end - start:
+                size >>= 1
+            rules.add(start, 33 - size.bit_length())
+            start += size
+    return rules
+
+def union(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """
+    并集
+    """
+    result = []
+    for start, end in heapq.merge(a, b):
+        if result and start <= result[-1][1]:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+def intersection(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """
+    交集
+    """
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        # 先结束的区间不会再与后面的区间相交
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+def complement(a: List[Interval]) -> List[Interval]:
+    """
+    相对于整个 IPv4 地址空间的补集
+    """
+    result = []
+    previous = 0
+    for start, end in a:
+        if start > previous:
+            result.append((previous, start))
+        previous = end
+    if previous < ADDRESS_SPACE_END:
+        result.append((previous, ADDRESS_SPACE_END))
+    return result
+
+def difference(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """
+    差集，即 a 中不属于 b 的部分
+    """
+    return intersection(a, complement(b))
+
+def compile_rules(rules: RuleSet, exclude: RuleSet) -> RuleSet:
+    """
+    从路由规则中排除指定网段，生成最少数量的规则
+    排除只作用于 IPv4 规则，IPv6 规则原样保留，排除 IPv6 网段时抛出 ValueError
+    """
+    if FAMILY_IPV6 in exclude.family:
+        raise ValueError("暂不支持排除 IPv6 网段")
+    result = to_rules(difference(from_rules(rules), from_rules(exclude)))
+    for index in range(len(rules)):
+        if rules.family[index] == FAMILY_IPV6:
+            result.add(rules.ipv6_network[rules.network[index]], rules.prefix[index],
+                       rules.action[index], FAMILY_IPV6)
+    return result
+
+def load_operand(text: str) -> List[Interval]:
+    """
+    读取运算对象，可以是每行一条规则的文件、单条 IP-CIDR 规则，或逗号分隔的 CIDR 列表
+    任何一条规则无效时抛出 ValueError，避免按空集合或部分集合计算
+    """
+    if os.path.isfile(text):
+        with open(text, 'r', encoding='utf-8') as f:
+            lines = [line for line in f.read().split('\n')
+                     if line.strip() and not line.strip().startswith('#')]
+        rules = RuleSet.from_strings(lines, strict=True)
+    # IP-CIDR 规则本身包含逗号，不能按逗号拆分
+    elif text.strip().startswith('IP-CIDR,'):
+        rules = RuleSet.from_strings([text], strict=True)
+    else:
+        try:
+            rules = RuleSet.from_strings(text.split(','), strict=True)
+        except ValueError as e:
+            raise ValueError(f"{text} 不是存在的文件，也不是有效的 CIDR 列表: {e}") from e
+    if FAMILY_IPV6 in rules.family:
+        raise ValueError(f"集合运算只支持 IPv4 网段: {text}")
+    return from_rules(rules)
+
+def main():
+    operations = {
+        'union': union,
+        'intersection': intersection,
+        'difference': difference,
+    }
+
+    try:
+        if len(sys.argv) == 3 and sys.argv[1] == 'complement':
+            result = complement(load_operand(sys.argv[2]))
+        elif len(sys.argv) == 4 and sys.argv[1] in operations:
+            result = operations[sys.argv[1]](load_operand(sys.argv[2]), load_operand(sys.argv[3]))
+        else:
+            result = None
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    if result is None:
+        print("用法:")
+        print("  python cidr_set.py union|intersection|difference <A> <B>")
+        print("  python cidr_set.py complement <A>")
+        print("A 和 B 可以是每行一条规则的文件、单条 IP-CIDR 规则，或逗号分隔的 CIDR 列表")
+        sys.exit(1)
+
+    for rule in to_rules(result).to_strings():
+        print(rule)
+
+if __name__ == "__main__":
+    main()
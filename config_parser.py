@@ -1,9 +1,10 @@
 import os
 import json
 import yaml
-from typing import List, Dict, Union, Optional
+from cidr_set import compile_rules
+from rules import RuleSet
 
-def parse_clash_config(file_path: str) -> List[str]:
+def parse_clash_config(file_path: str) -> RuleSet:
     """
     解析 Clash 配置文件，提取 IP-CIDR 规则
     """
@@ -13,19 +14,17 @@ def parse_clash_config(file_path: str) -> List[str]:
         
         if 'rules' not in config:
             print("未找到 rules 部分")
-            return []
+            return RuleSet()
             
-        ip_cidr_rules = []
-        for rule in config['rules']:
-            if isinstance(rule, str) and rule.startswith('IP-CIDR,') and rule.endswith(',DIRECT'):
-                ip_cidr_rules.append(rule)
+        ip_cidr_rules = [rule for rule in config['rules']
+                         if isinstance(rule, str) and rule.startswith('IP-CIDR,') and rule.endswith(',DIRECT')]
                 
-        return ip_cidr_rules
+        return RuleSet.from_strings(ip_cidr_rules)
     except Exception as e:
         print(f"解析 Clash 配置文件时出错: {e}")
-        return []
+        return RuleSet()
 
-def parse_v2ray_config(file_path: str) -> List[str]:
+def parse_v2ray_config(file_path: str) -> RuleSet:
     """
     解析 V2Ray 配置文件，提取 IP-CIDR 规则
     支持两种格式：
@@ -58,7 +57,7 @@ def parse_v2ray_config(file_path: str) -> List[str]:
                     for ip in ip_list:
                         if ip.startswith('geoip:'):
                             continue
-                        ip_cidr_rules.append(f"IP-CIDR,{ip},DIRECT")
+                        ip_cidr_rules.append(ip)
         # 检查是否是仅包含路由规则的配置
         elif isinstance(config, list):
             for rule in config:
@@ -75,23 +74,23 @@ def parse_v2ray_config(file_path: str) -> List[str]:
                 for ip in ip_list:
                     if ip.startswith('geoip:'):
                         continue
-                    ip_cidr_rules.append(f"IP-CIDR,{ip},DIRECT")
+                    ip_cidr_rules.append(ip)
         else:
             print("未找到有效的路由规则")
-            return []
+            return RuleSet()
             
-        return ip_cidr_rules
+        return RuleSet.from_strings(ip_cidr_rules)
     except Exception as e:
         print(f"解析 V2Ray 配置文件时出错: {e}")
-        return []
+        return RuleSet()
 
-def export_clash_config(rules: List[str], output_path: str) -> bool:
+def export_clash_config(rules: RuleSet, output_path: str) -> bool:
     """
     导出 Clash 配置规则
     """
     try:
         config = {
-            'rules': rules
+            'rules': rules.to_strings()
         }
         
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -101,7 +100,7 @@ def export_clash_config(rules: List[str], output_path: str) -> bool:
         print(f"导出 Clash 配置时出错: {e}")
         return False
 
-def export_v2ray_config(rules: List[str], output_path: str) -> bool:
+def export_v2ray_config(rules: RuleSet, output_path: str) -> bool:
     """
     导出 V2Ray 配置规则
     """
@@ -113,7 +112,7 @@ def export_v2ray_config(rules: List[str], output_path: str) -> bool:
                     'rules': [
                         {
                             'outboundTag': 'direct',
-                            'ip': [rule.split(',')[1] for rule in rules],
+                            'ip': rules.cidrs(),
                             'enabled': True
                         }
                     ],
@@ -206,7 +205,7 @@ def main():
             return
             
         print(f"\n找到 {len(rules)} 条 IP-CIDR 规则:")
-        for rule in rules:
+        for rule in rules.to_strings():
             print(rule)
             
         save = input("\n是否保存这些规则到配置文件？(y/n): ")
@@ -216,7 +215,7 @@ def main():
             config_path = os.path.join('config', 'network_config.json')
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
-            config['ip_cidrs'] = rules
+            config['ip_cidrs'] = rules.to_strings()
             with open(config_path, 'w', encoding='utf-8') as f:
                 json.dump(config, f, ensure_ascii=False, indent=4)
             print("规则已保存到配置文件")
@@ -227,7 +226,14 @@ def main():
             config_path = os.path.join('config', 'network_config.json')
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
-            rules = config.get('ip_cidrs', [])
+            rules = RuleSet.from_strings(config.get('ip_cidrs', []))
+            # 导出排除指定网段后实际生效的规则
+            if rules and config.get('exclude_cidrs'):
+                try:
+                    rules = compile_rules(rules, RuleSet.from_strings(config['exclude_cidrs'], strict=True))
+                except ValueError as e:
+                    print(f"排除网段无效，已取消导出: {e}")
+                    return
             
             if not rules:
                 print("未找到可导出的规则")
@@ -0,0 +1,243 @@
+import re
+import subprocess
+from typing import List, Dict, Optional
+
+from rules import RuleSet, ip_to_int, int_to_ip, prefix_to_mask, ACTIONS, FAMILY_IPV4
+
+# route print 中 IPv4 活动路由的行格式: 网络目标 网络掩码 网关 接口 跃点数
+ROUTE_LINE_PATTERN = re.compile(
+    r'^\s*(\d{1,3}(?:\.\d{1,3}){3})\s+(\d{1,3}(?:\.\d{1,3}){3})\s+(\S+)\s+'
+    r'(\d{1,3}(?:\.\d{1,3}){3})\s+(\d+)\s*$'
+)
+
+# 在链路上的网关在不同语言的系统中显示不同
+ON_LINK_GATEWAYS = ('在链路上', 'On-link')
+
+def netmask_to_prefix(netmask: str) -> Optional[int]:
+    """
+    将子网掩码转换为前缀长度，非连续掩码返回 None
+    """
+    mask = ip_to_int(netmask)
+    prefix = bin(mask).count('1')
+    if mask != prefix_to_mask(prefix):
+        return None
+    return prefix
+
+def parse_route_table(output: str) -> List[Dict]:
+    """
+    解析 route print 的输出，提取 IPv4 活动路由
+    永久路由和 IPv6 路由的列数不同，不会被匹配
+    """
+    routes = []
+    for line in output.split('\n'):
+        match = ROUTE_LINE_PATTERN.match(line)
+        if not match:
+            continue
+        network, netmask, gateway, interface, metric = match.groups()
+        try:
+            prefix = netmask_to_prefix(netmask)
+            if prefix is None:
+                continue
+            start = ip_to_int(network) & prefix_to_mask(prefix)
+        except ValueError:
+            continue
+        routes.append({
+            'network': int_to_ip(start),
+            'prefix': prefix,
+            'gateway': gateway,
+            'interface': interface,
+            'metric': int(metric),
+            'start': start,
+            'end': start + (1 << (32 - prefix)) - 1
+        })
+    return routes
+
+def find_route(system_routes: List[Dict], ip: str) -> Optional[Dict]:
+    """
+    按最长前缀匹配查找访问指定地址时使用的路由，前缀相同时选择跃点数最小的
+    """
+    address = ip_to_int(ip)
+    best = None
+    for route in system_routes:
+        if route['start'] <= address <= route['end']:
+            if best is None or (route['prefix'], -route['metric']) > (best['prefix'], -best['metric']):
+                best = route
+    return best
+
+def format_rule(rules: RuleSet, index: int) -> str:
+    """
+    生成规则集合中第 index 条规则的 IP-CIDR 字符串，仅在打印报告时使用
+    """
+    return f"IP-CIDR,{rules.cidr(index)},{ACTIONS[rules.action[index]]}"
+
+def analyze_routes(system_routes: List[Dict], rules: RuleSet,
+                   gateway: Optional[str] = None) -> Dict[str, List[Dict]]:
+    """
+    分析配置的路由规则与系统路由表之间的冲突
+
+    CIDR 前缀之间只存在包含或不相交两种关系，因此按 (起始地址, 前缀长度) 排序后
+    用栈扫描一遍即可找到每个前缀的所有外层前缀，整体复杂度为 O(n log n)
+
+    规则直接从 RuleSet 的列中读取，报告中以下标引用规则，返回的报告包含:
+    - shadowed: 位于规则内部、不经过校园网接口的更具体的系统路由，会截走部分流量
+    - overlapping: 相互包含或重复的配置规则
+    - conflicting_gateway: 与规则前缀完全相同但不经过校园网接口的系统路由
+
+    经由校园网网关，或位于校园网接口上 (例如接口所在子网的在链路上路由) 的系统路由
+    与规则的去向一致，不视为冲突
+    """
+    report = {'shadowed': [], 'overlapping': [], 'conflicting_gateway': []}
+
+    # 包含校园网网关的路由所在的接口即为校园网接口，默认路由无法说明网关所在接口
+    campus_interface = None
+    if gateway is not None:
+        try:
+            gateway_route = find_route(system_routes, gateway)
+        except ValueError:
+            gateway_route = None
+        if gateway_route is not None and gateway_route['prefix'] > 0:
+            campus_interface = gateway_route['interface']
+
+    def is_consistent(route):
+        return route['gateway'] == gateway or (
+            campus_interface is not None and route['interface'] == campus_interface)
+
+    # 系统路由排在同前缀的规则之前，这样处理规则时栈顶即为相同前缀的系统路由
+    entries = [(route['start'], route['prefix'], 0, route) for route in system_routes]
+    entries.extend((network, prefix, 1, index)
+                   for index, (network, prefix, family) in enumerate(zip(rules.network, rules.prefix, rules.family))
+                   if family == FAMILY_IPV4)
+    entries.sort(key=lambda entry: entry[:3])
+
+    def has_same_rule(position, start, prefix):
+        # 同前缀的系统路由排在规则之前，跳过它们后检查下一项是否为同前缀的规则
+        position += 1
+        while position < len(entries) and entries[position][:3] == (start, prefix, 0):
+            position += 1
+        return position < len(entries) and entries[position][:3] == (start, prefix, 1)
+
+    # 栈中保存 (结束地址, 路由或规则下标)
+    system_stack = []
+    rule_stack = []
+    for position, (start, prefix, kind, item) in enumerate(entries):
+        # 弹出已经结束的前缀，剩下的都是包含当前前缀的外层前缀
+        while system_stack and system_stack[-1][0] < start:
+            system_stack.pop()
+        while rule_stack and rule_stack[-1][0] < start:
+            rule_stack.pop()
+
+        if kind == 0:
+            if rule_stack and not is_consistent(item):
+                # 本机地址和广播地址的主机路由不影响转发，忽略
+                # 与某条规则前缀完全相同的路由会作为该规则的网关冲突报告，不再重复报告
+                if not (item['prefix'] == 32 and item['gateway'] in ON_LINK_GATEWAYS) and \
+                        not has_same_rule(position, start, prefix):
+                    report['shadowed'].append({'rule': rule_stack[-1][1], 'route': item})
+            system_stack.append((item['end'], item))
+        else:
+            if rule_stack:
+                report['overlapping'].append({'rule': item, 'outer': rule_stack[-1][1]})
+            for _, route in reversed(system_stack):
+                if route['start'] != start or route['prefix'] != prefix:
+                    break
+                if not is_consistent(route):
+                    report['conflicting_gateway'].append({'rule': item, 'route': route})
+            rule_stack.append((start + (1 << (32 - prefix)) - 1, item))
+
+    return report
+
+def print_analysis_report(report: Dict[str, List[Dict]], rules: RuleSet) -> int:
+    """
+    打印冲突分析报告，返回发现的问题数量
+    """
+    total = sum(len(items) for items in report.values())
+    if total == 0:
+        print("未发现路由冲突")
+        return 0
+
+    if report['shadowed']:
+        print(f"\n被更具体路由覆盖的规则 ({len(report['shadowed'])}):")
+        for entry in report['shadowed']:
+            rule = entry['rule']
+            route = entry['route']
+            print(f"- {int_to_ip(rules.network[rule])}/{rules.prefix[rule]} 中的 {route['network']}/{route['prefix']} "
+                  f"经由 {route['gateway']} (接口 {route['interface']}, 跃点数 {route['metric']})")
+
+    if report['overlapping']:
+        print(f"\n相互重叠的规则 ({len(report['overlapping'])}):")
+        for entry in report['overlapping']:
+            rule = entry['rule']
+            outer = entry['outer']
+            if rules.prefix[rule] == rules.prefix[outer]:
+                print(f"- {format_rule(rules, rule)} 与 {format_rule(rules, outer)} 重复")
+            else:
+                print(f"- {format_rule(rules, rule)} 已被 {format_rule(rules, outer)} 包含")
+
+    if report['conflicting_gateway']:
+        print(f"\n网关冲突的规则 ({len(report['conflicting_gateway'])}):")
+        for entry in report['conflicting_gateway']:
+            rule = entry['rule']
+            route = entry['route']
+            print(f"- {int_to_ip(rules.network[rule])}/{rules.prefix[rule]} 已存在经由 {route['gateway']} 的路由 "
+                  f"(接口 {route['interface']}, 跃点数 {route['metric']})")
+
+    return total
+
+def get_route_table() -> Optional[str]:
+    """
+    获取当前系统的路由表输出
+    """
+    try:
+        result = subprocess.run(['route', 'print', '-4'], capture_output=True, text=True)
+        if result.returncode != 0:
+            print("获取路由表失败")
+            return None
+        return result.stdout
+    except Exception as e:
+        print(f"获取路由表时出错: {e}")
+        return None
+
+def check_route_conflicts(gateway: Optional[str], rules: RuleSet,
+                          route_output: Optional[str] = None) -> int:
+    """
+    检查配置的路由规则与系统路由表的冲突并打印报告
+    未提供 route_output 时读取当前系统路由表
+    """
+    if route_output is None:
+        route_output = get_route_table()
+        if route_output is None:
+            return 0
+
+    system_routes = parse_route_table(route_output)
+    print(f"\n分析 {sum(1 for _ in rules.ipv4())} 条规则与 {len(system_routes)} 条系统路由...")
+    report = analyze_routes(system_routes, rules, gateway)
+    return print_analysis_report(report, rules)
+
+def main():
+    import sys
+    from app import load_config, get_rules, IP_CIDRS
+
+    config = load_config()
+    if config:
+        gateway = config['campus_gateway']
+        try:
+            rules = get_rules(config)
+        except ValueError as e:
+            print(f"排除网段无效: {e}")
+            sys.exit(1)
+    else:
+        print("未找到保存的配置，使用默认路由规则。")
+        gateway = None
+        rules = RuleSet.from_strings(IP_CIDRS)
+
+    # 可以指定保存的 route print 输出文件进行离线分析
+    route_output = None
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8', errors='replace') as f:
+            route_output = f.read()
+
+    problems = check_route_conflicts(gateway, rules, route_output)
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
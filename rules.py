@@ -0,0 +1,147 @@
+import ipaddress
+from array import array
+from typing import Iterator, List, Tuple
+
+# 地址族，路由只支持 IPv4，IPv6 规则只用于导入和导出
+FAMILY_IPV4 = 4
+FAMILY_IPV6 = 6
+
+# 规则动作，按下标存储
+ACTIONS = ('DIRECT',)
+
+def ip_to_int(ip: str) -> int:
+    """
+    将点分十进制 IPv4 地址转换为整数
+    """
+    parts = ip.split('.')
+    if len(parts) != 4:
+        raise ValueError(f"无效的 IPv4 地址: {ip}")
+    value = 0
+    for part in parts:
+        octet = int(part)
+        if not (0 <= octet <= 255):
+            raise ValueError(f"无效的 IPv4 地址: {ip}")
+        value = (value << 8) | octet
+    return value
+
+def int_to_ip(value: int) -> str:
+    """
+    将整数转换为点分十进制 IPv4 地址
+    """
+    return '.'.join(str((value >> shift) & 0xff) for shift in (24, 16, 8, 0))
+
+def prefix_to_mask(prefix: int) -> int:
+    """
+    将前缀长度转换为整数形式的子网掩码
+    """
+    return (0xffffffff << (32 - prefix)) & 0xffffffff
+
+def prefix_to_netmask(prefix: int) -> str:
+    """
+    将前缀长度转换为点分十进制的子网掩码
+    """
+    return int_to_ip(prefix_to_mask(prefix))
+
+def parse_rule(text: str) -> Tuple[int, int, int, int]:
+    """
+    解析一条规则，支持 IP-CIDR,ip/n,DIRECT 和 ip/n 两种格式
+    返回 (网络地址, 前缀长度, 动作下标, 地址族)，主机位会被清零
+    """
+    text = text.strip()
+    action = 'DIRECT'
+    if text.startswith('IP-CIDR,'):
+        parts = text.split(',')
+        if len(parts) != 3:
+            raise ValueError(f"无效的路由格式: {text}")
+        text, action = parts[1], parts[2]
+    if action not in ACTIONS:
+        raise ValueError(f"不支持的规则动作: {action}")
+    if ':' in text:
+        network = ipaddress.IPv6Network(text, strict=False)
+        return int(network.network_address), network.prefixlen, ACTIONS.index(action), FAMILY_IPV6
+    if '/' in text:
+        ip, cidr = text.split('/')
+        prefix = int(cidr)
+    else:
+        ip, prefix = text, 32
+    if not (0 <= prefix <= 32):
+        raise ValueError(f"无效的 CIDR 值: {prefix}")
+    return ip_to_int(ip) & prefix_to_mask(prefix), prefix, ACTIONS.index(action), FAMILY_IPV4
+
+class RuleSet:
+    """
+    紧凑的路由规则集合
+
+    规则按列存储在 array 中，每条规则只占用几个字节，而不是一个 Python 字符串。
+    规则字符串只在导入时解析一次，应用、重置、分析和导出都直接使用这些列。
+    IPv6 地址放不进 32 位的 network 列，单独存放在 ipv6_network 中，
+    network 列保存其下标；路由相关的操作通过 ipv4() 只处理 IPv4 规则。
+    """
+    __slots__ = ('network', 'prefix', 'family', 'action', 'ipv6_network')
+
+    def __init__(self):
+        self.network = array('I')
+        self.prefix = array('B')
+        self.family = array('B')
+        self.action = array('B')
+        self.ipv6_network = []
+
+    @classmethod
+    def from_strings(cls, rules: List[str], strict: bool = False) -> 'RuleSet':
+        """
+        从规则字符串列表创建规则集合，无效的规则会被跳过并打印原因
+        strict 为 True 时遇到无效规则抛出 ValueError
+        """
+        rule_set = cls()
+        for rule in rules:
+            try:
+                rule_set.add(*parse_rule(rule))
+            except ValueError as e:
+                if strict:
+                    raise ValueError(f"处理路由 {rule} 时出错: {e}") from e
+                print(f"处理路由 {rule} 时出错: {e}")
+        return rule_set
+
+    def add(self, network: int, prefix: int, action: int = 0, family: int = FAMILY_IPV4):
+        """
+        添加一条已解析的规则
+        """
+        if family == FAMILY_IPV6:
+            self.ipv6_network.append(network)
+            network = len(self.ipv6_network) - 1
+        self.network.append(network)
+        self.prefix.append(prefix)
+        self.family.append(family)
+        self.action.append(action)
+
+    def __len__(self) -> int:
+        return len(self.network)
+
+    def ipv4(self) -> Iterator[Tuple[int, int, int]]:
+        """
+        依次返回每条 IPv4 规则的 (网络地址, 前缀长度, 动作下标)
+        """
+        for network, prefix, family, action in zip(self.network, self.prefix, self.family, self.action):
+            if family == FAMILY_IPV4:
+                yield network, prefix, action
+
+    def cidr(self, index: int) -> str:
+        """
+        返回第 index 条规则 ip/n 格式的网段
+        """
+        if self.family[index] == FAMILY_IPV6:
+            network = ipaddress.IPv6Address(self.ipv6_network[self.network[index]])
+            return f"{network}/{self.prefix[index]}"
+        return f"{int_to_ip(self.network[index])}/{self.prefix[index]}"
+
+    def cidrs(self) -> List[str]:
+        """
+        返回 ip/n 格式的网段列表
+        """
+        return [self.cidr(index) for index in range(len(self))]
+
+    def to_strings(self) -> List[str]:
+        """
+        返回 IP-CIDR,ip/n,DIRECT 格式的规则列表，用于保存和导出
+        """
+        return [f"IP-CIDR,{self.cidr(index)},{ACTIONS[self.action[index]]}" for index in range(len(self))]
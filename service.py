@@ -0,0 +1,267 @@
+import io
+import os
+import sys
+import hmac
+import json
+import secrets
+import getpass
+import subprocess
+import contextlib
+from multiprocessing.connection import Listener, Client
+
+# 服务地址，Windows 上使用命名管道，其他系统使用 Unix 套接字
+if sys.platform == 'win32':
+    SERVICE_ADDRESS = r'\\.\pipe\win_network_routing'
+else:
+    SERVICE_ADDRESS = os.path.join('config', 'service.sock')
+
+# 服务启动时生成的认证密钥，客户端读取该文件连接服务
+AUTHKEY_FILE = os.path.join('config', 'service.key')
+
+# 等待客户端发送请求的超时时间 (秒)，避免空闲连接阻塞服务
+REQUEST_TIMEOUT = 5
+
+# 单个请求的最大长度 (字节)
+MAX_REQUEST_SIZE = 4096
+
+def get_config_mtime():
+    """
+    获取配置文件的修改时间，文件不存在时返回 None
+    """
+    from app import CONFIG_FILE
+
+    try:
+        return os.path.getmtime(CONFIG_FILE)
+    except OSError:
+        return None
+
+def load_config_state():
+    """
+    加载配置和已解析的路由规则
+    """
+    from app import load_config, get_rules
+
+    config_mtime = get_config_mtime()
+    config = load_config()
+    rules = None
+    rules_error = None
+    if config:
+        try:
+            rules = get_rules(config)
+        except ValueError as e:
+            rules_error = str(e)
+    return {
+        'config': config,
+        'config_mtime': config_mtime,
+        'rules': rules,
+        'rules_error': rules_error
+    }
+
+def load_state():
+    """
+    加载配置、网络连接和路由表快照
+    """
+    from app import get_network_connections
+    from route_analyzer import get_route_table
+
+    state = load_config_state()
+    state['connections'] = get_network_connections()
+    state['route_output'] = get_route_table()
+    return state
+
+def handle_request(state, operation, args):
+    """
+    在常驻的状态上执行一次操作，返回是否继续运行服务
+    """
+    from app import reset_settings, show_current_routes, show_route_for, apply_settings
+    from route_analyzer import get_route_table
+
+    # app.py 或 config_parser.py 修改配置文件后重新加载
+    if get_config_mtime() != state['config_mtime']:
+        state.update(load_config_state())
+
+    config = state['config']
+    if operation in ('apply', 'reset') and not config:
+        print("未找到保存的配置，请先运行 python app.py 进行配置。")
+    elif operation == 'apply' and state['rules'] is None:
+        print(f"排除网段无效，已取消应用: {state['rules_error']}")
+    elif operation in ('apply', 'reset'):
+        # 路由可能已被其他程序修改，应用和重置前重新读取一次路由表
+        state['route_output'] = get_route_table()
+        if operation == 'apply':
+            apply_settings(config, state['route_output'], state['rules'])
+        else:
+            reset_settings(config, state['route_output'], state['rules'])
+        state['route_output'] = get_route_table()
+    elif operation == 'show':
+        show_current_routes(state['route_output'])
+    elif operation == 'which' and args:
+        show_route_for(args[0], state['route_output'])
+    elif operation == 'status':
+        print("网络连接:")
+        for conn in state['connections']:
+            print(f"- {conn['name']} ({conn['admin_status']} {conn['conn_status']})")
+        if config:
+            print(f"你的网络: {config['user_connection']} 网关 {config['user_gateway']}")
+            print(f"校园网络: {config['campus_connection']} 网关 {config['campus_gateway']}")
+            if state['rules'] is not None:
+                print(f"路由规则: {len(state['rules'])} 条")
+            else:
+                print(f"排除网段无效: {state['rules_error']}")
+    elif operation == 'refresh':
+        state.update(load_state())
+        print("已重新加载配置和路由表")
+    elif operation == 'stop':
+        print("服务已停止")
+        return False
+    else:
+        print(f"无效的操作: {operation}")
+    return True
+
+def write_authkey(authkey):
+    """
+    写入认证密钥，只允许当前用户读取
+    """
+    if os.path.exists(AUTHKEY_FILE):
+        os.remove(AUTHKEY_FILE)
+    fd = os.open(AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+
+    # Windows 上 0o600 不会限制其他用户，改用 ACL 只授权当前用户
+    if sys.platform == 'win32':
+        subprocess.run(['icacls', AUTHKEY_FILE, '/inheritance:r', '/grant:r', f'{getpass.getuser()}:F'],
+                       check=True, capture_output=True, text=True)
+
+def receive_request(conn, authkey):
+    """
+    读取并校验一个请求，超时、格式错误或密钥不匹配时返回 None
+    请求使用 JSON 而不是 pickle，避免反序列化未认证的数据
+    """
+    if not conn.poll(REQUEST_TIMEOUT):
+        print("等待请求超时")
+        return None
+    try:
+        message = json.loads(conn.recv_bytes(MAX_REQUEST_SIZE).decode('utf-8'))
+        key = bytes.fromhex(message['key'])
+        operation = message['operation']
+        args = [str(arg) for arg in message.get('args', [])]
+    except Exception as e:
+        print(f"无效的请求: {e}")
+        return None
+    if not hmac.compare_digest(key, authkey):
+        print("认证失败")
+        return None
+    return operation, args
+
+def is_running():
+    """
+    检查是否已有服务实例在监听，能够建立连接即视为正在运行
+    """
+    try:
+        with Client(SERVICE_ADDRESS) as conn:
+            # 发送一个空请求，让正在运行的服务立即关闭连接而不是等待超时
+            conn.send_bytes(b'{}')
+        return True
+    except OSError:
+        return False
+
+def serve():
+    """
+    以常驻服务方式运行，保留配置和路由表快照，避免每次调用重新启动和探测网络
+    已有实例在运行时不做任何修改并返回 False
+    """
+    # 先确认没有正在运行的实例，避免删除它的套接字或替换它的认证密钥
+    # Windows 上可以创建同名管道的第二个实例，同样需要检查
+    if is_running():
+        print(f"服务已在运行: {SERVICE_ADDRESS}")
+        return False
+
+    os.makedirs('config', exist_ok=True)
+    authkey = secrets.token_bytes(32)
+
+    # 清理上次异常退出时残留的套接字文件
+    if sys.platform != 'win32' and os.path.exists(SERVICE_ADDRESS):
+        os.remove(SERVICE_ADDRESS)
+
+    try:
+        write_authkey(authkey)
+        state = load_state()
+
+        # 套接字文件同样只允许当前用户访问
+        old_umask = os.umask(0o077) if sys.platform != 'win32' else None
+        try:
+            listener = Listener(SERVICE_ADDRESS)
+        finally:
+            if old_umask is not None:
+                os.umask(old_umask)
+        print(f"服务已启动: {SERVICE_ADDRESS}")
+
+        running = True
+        with listener:
+            while running:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"接受连接时出错: {e}")
+                    continue
+                with conn:
+                    try:
+                        request_data = receive_request(conn, authkey)
+                        if request_data is None:
+                            continue
+                        operation, args = request_data
+                        output = io.StringIO()
+                        with contextlib.redirect_stdout(output):
+                            try:
+                                running = handle_request(state, operation, args)
+                            except Exception as e:
+                                print(f"处理请求时出错: {e}")
+                        conn.send_bytes(output.getvalue().encode('utf-8'))
+                    except Exception as e:
+                        print(f"与客户端通信时出错: {e}")
+        return True
+    finally:
+        if os.path.exists(AUTHKEY_FILE):
+            os.remove(AUTHKEY_FILE)
+        if sys.platform != 'win32' and os.path.exists(SERVICE_ADDRESS):
+            os.remove(SERVICE_ADDRESS)
+
+def request(operation, args=()):
+    """
+    向常驻服务发送一次操作请求并返回输出
+    """
+    with open(AUTHKEY_FILE, 'rb') as f:
+        authkey = f.read()
+    message = {'key': authkey.hex(), 'operation': operation, 'args': list(args)}
+    with Client(SERVICE_ADDRESS) as conn:
+        conn.send_bytes(json.dumps(message).encode('utf-8'))
+        return conn.recv_bytes().decode('utf-8')
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法:")
+        print("  python service.py --serve    启动常驻服务")
+        print("  python service.py <操作>     向服务发送请求")
+        print("可用操作: apply, reset, show, which <IP>, status, refresh, stop")
+        sys.exit(1)
+
+    if sys.argv[1] == '--serve':
+        try:
+            if not serve():
+                sys.exit(1)
+        except KeyboardInterrupt:
+            print("服务已停止")
+        return
+
+    try:
+        print(request(sys.argv[1], sys.argv[2:]), end='')
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("服务未运行，请先运行 python service.py --serve")
+        sys.exit(1)
+    except EOFError:
+        print("服务拒绝了请求，请检查认证密钥")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()